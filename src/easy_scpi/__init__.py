@@ -1,2 +1,4 @@
 from easy_scpi.scpi_instrument import SCPI_Instrument as Instrument
-from easy_scpi.scpi_instrument import Property
\ No newline at end of file
+from easy_scpi.scpi_instrument import Property
+from easy_scpi.async_scpi_instrument import AsyncSCPI_Instrument as AsyncInstrument
+from easy_scpi.async_scpi_instrument import connect_async
\ No newline at end of file
@@ -0,0 +1,525 @@
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from easy_scpi.scpi_instrument import SCPI_Instrument, Property, _pyvisa
+
+
+class AsyncSCPI_Instrument:
+    """
+    Represents an instrument communicating asynchronously.
+
+    Blocking VISA calls are run on a worker thread dedicated to the instrument,
+    so multiple instruments can communicate concurrently from one event loop.
+    Commands are built the same way as for a SCPI_Instrument,
+    but calls return awaitables.
+
+    To read an property:  await inst.p1.p2.p3()
+    To call a function:   await inst.p1.p2( 'value' )
+    To execute a command: await inst.p1.p2.p3( '' )
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Creates an instance of an asynchronous Instrument.
+        Arguments are passed to SCPI_Instrument.
+
+        :returns: An asynchronous Instrument communicator.
+        """
+        self.__inst = SCPI_Instrument(*args, **kwargs)
+        self.__prop_cache = {}  # cache of root properties
+
+        # single worker serializes access, VISA sessions are not thread safe
+        self.__io_pool = ThreadPoolExecutor(max_workers=1)
+
+        # pending asynchronous reads of an active async session, by job id
+        self.__jobs = None
+        self.__event_lock = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            # private and special attributes are never SCPI commands
+            raise AttributeError(name)
+
+        prop = self.__prop_cache.get(name)
+        if prop is None:
+            prop = Property(
+                self,
+                self.__inst.prefix_cmds * ":" + name,
+                arg_separator=self.__inst.arg_separator,
+            )
+            self.__prop_cache[name] = prop
+
+        return prop
+
+    async def __aenter__(self):
+        if not self.connected:
+            await self.connect()
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    @property
+    def sync_instrument(self):
+        """
+        Returns the underlying synchronous SCPI_Instrument.
+        """
+        return self.__inst
+
+    @property
+    def backend(self):
+        return self.__inst.backend
+
+    @property
+    def instrument(self):
+        return self.__inst.instrument
+
+    @property
+    def port(self):
+        return self.__inst.port
+
+    @property
+    def rid(self):
+        """
+        Return the resource id of the instrument.
+        """
+        return self.__inst.rid
+
+    @property
+    def arg_separator(self):
+        """
+        Separator to use between arguments.
+        """
+        return self.__inst.arg_separator
+
+    @arg_separator.setter
+    def arg_separator(self, arg_separator):
+        """
+        :param arg_separator: Separator to use between arguments.
+        """
+        self.__inst.arg_separator = arg_separator
+        self.__prop_cache.clear()
+
+    @property
+    def prefix_cmds(self):
+        """
+        Prefix all commands with a colon.
+        """
+        return self.__inst.prefix_cmds
+
+    @prefix_cmds.setter
+    def prefix_cmds(self, prefix_cmds):
+        """
+        :param prefix_cmds: Whether to prefix all commands with a colon.
+        """
+        self.__inst.prefix_cmds = prefix_cmds
+        self.__prop_cache.clear()
+
+    @property
+    def supports_compound(self):
+        """
+        Whether the instrument accepts multiple commands in one message.
+        """
+        return self.__inst.supports_compound
+
+    @supports_compound.setter
+    def supports_compound(self, supports_compound):
+        """
+        :param supports_compound: Whether the instrument accepts
+            multiple commands in one message.
+        """
+        self.__inst.supports_compound = supports_compound
+
+    @property
+    def id(self):
+        """
+        Returns the id of the instrument.
+        """
+        return self._run(getattr, self.__inst, "id")
+
+    async def force_id(self):
+        """
+        Queries the id of the instrument, ignoring any cached id.
+
+        :returns: Id of the instrument.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.force_id)
+
+    @property
+    def value(self):
+        """
+        Get current value.
+        """
+        return self._run(getattr, self.__inst, "value")
+
+    @property
+    def connected(self):
+        """
+        Returns if the instrument is connected.
+        """
+        return self.__inst.connected
+
+    @property
+    def is_connected(self):
+        """
+        Alias for connected.
+        """
+        return self.connected
+
+    async def connect(self):
+        """
+        Connects to the instrument on the given port.
+        """
+        return await self._run(self.__inst.connect)
+
+    async def disconnect(self):
+        """
+        Disconnects from the instrument, and returns local control.
+        """
+        return await self._run(self.__inst.disconnect)
+
+    async def write(self, msg):
+        """
+        Delegates write to resource.
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.write, msg)
+
+    async def read(self):
+        """
+        Delegates read to resource.
+
+        :returns: Response from the read.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.read)
+
+    async def query(self, msg):
+        """
+        Delegates query to resource.
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.query, msg)
+
+    async def query_binary_values(
+        self, msg, datatype="f", is_big_endian=False, container=list
+    ):
+        """
+        Delegates binary query to resource.
+        See SCPI_Instrument#query_binary_values.
+
+        :param msg: Message to send.
+        :param datatype: struct format character of the values. [Default: 'f']
+        :param is_big_endian: Whether the values are big endian. [Default: False]
+        :param container: Type of the returned values,
+            e.g. `numpy.array`. [Default: list]
+        :returns: Values of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(
+            functools.partial(
+                self.__inst.query_binary_values,
+                msg,
+                datatype=datatype,
+                is_big_endian=is_big_endian,
+                container=container,
+            )
+        )
+
+    async def query_ascii_values(
+        self, msg, converter="f", separator=",", container=list
+    ):
+        """
+        Delegates ASCII values query to resource.
+        See SCPI_Instrument#query_ascii_values.
+
+        :param msg: Message to send.
+        :param converter: Format character or function
+            used to convert each value. [Default: 'f']
+        :param separator: Separator between values. [Default: ',']
+        :param container: Type of the returned values,
+            e.g. `numpy.array`. [Default: list]
+        :returns: Values of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(
+            functools.partial(
+                self.__inst.query_ascii_values,
+                msg,
+                converter=converter,
+                separator=separator,
+                container=container,
+            )
+        )
+
+    async def query_raw(self, msg, count):
+        """
+        Writes a message, then reads an exact number of bytes.
+        See SCPI_Instrument#query_raw.
+
+        :param msg: Message to send.
+        :param count: Number of bytes to read.
+        :returns: Bytes of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.query_raw, msg, count)
+
+    async def write_many(self, *msgs, handshake_per_command=False):
+        """
+        Sends multiple commands as a single compound message.
+        See SCPI_Instrument#write_many.
+
+        :param msgs: Messages to send.
+        :param handshake_per_command: Read a handshake for each command
+            instead of a single one for the whole message. [Default: False]
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(
+            functools.partial(
+                self.__inst.write_many,
+                *msgs,
+                handshake_per_command=handshake_per_command,
+            )
+        )
+
+    async def query_many(self, *msgs):
+        """
+        Sends multiple queries as a single compound message.
+        See SCPI_Instrument#query_many.
+
+        :param msgs: Messages to send.
+        :returns: List of responses, one for each message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        return await self._run(self.__inst.query_many, *msgs)
+
+    async def reset(self):
+        """
+        Resets the meter to inital state.
+        Sends `*RST` command.
+
+        :returns: Response from the command.
+        """
+        return await self.write("*RST")
+
+    async def init(self):
+        """
+        Initialize the instrument.
+        Sends the `INIT` command.
+
+        :returns: Response from the command.
+        """
+        return await self.write("INIT")
+
+    @asynccontextmanager
+    async def async_session(self):
+        """
+        Enables reads completed by VISA I/O completion events,
+        used by #event_read and #event_query.
+        The event handler is installed once for the whole session,
+        instead of for each read.
+        Requires a VISA library supporting asynchronous I/O, e.g. NI-VISA.
+
+        async with inst.async_session():
+            value = await inst.event_query('READ?')
+
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        if self.__jobs is not None:
+            yield self
+            return
+
+        resource = self.__inst.instrument
+        if resource is None:
+            raise RuntimeError("Can not start session, instrument not connected.")
+
+        loop = asyncio.get_running_loop()
+        jobs = {}
+
+        def handle_completion(resource, event, user_handle):
+            # called from a VISA thread, event is only valid during the call
+            loop.call_soon_threadsafe(
+                _complete_job, jobs, event.job_id, event.status, event.data
+            )
+
+        handler = resource.wrap_handler(handle_completion)
+        constants = _pyvisa().constants
+        io_completion = constants.EventType.io_completion
+        mechanism = constants.EventMechanism.handler
+        user_handle = resource.install_handler(io_completion, handler)
+        try:
+            resource.enable_event(io_completion, mechanism)
+
+            self.__jobs = jobs
+            self.__event_lock = asyncio.Lock()
+            try:
+                yield self
+
+            finally:
+                self.__jobs = None
+                self.__event_lock = None
+                resource.disable_event(io_completion, mechanism)
+
+        finally:
+            resource.uninstall_handler(io_completion, handler, user_handle)
+
+    async def event_read(self):
+        """
+        Reads using VISA asynchronous I/O.
+        Must be used in an #async_session.
+        Event reads bypass the worker thread, so should not be
+        made while other operations on the instrument are pending.
+
+        :returns: Response from the read.
+        :raises RuntimeError: If an async session is not active.
+        """
+        if self.__jobs is None:
+            raise RuntimeError("Can not read, async session not active.")
+
+        async with self.__event_lock:
+            return await self._event_read()
+
+    async def event_query(self, msg):
+        """
+        Writes a message, then reads the response using VISA asynchronous I/O.
+        Must be used in an #async_session.
+        [See #event_read.]
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an async session is not active,
+            or the handshake does not match.
+        """
+        if self.__jobs is None:
+            raise RuntimeError("Can not query, async session not active.")
+
+        async with self.__event_lock:
+            # handshake follows the response, so is read below
+            await self._run(self.__inst._write, msg)
+            resp = await self._event_read()
+
+            handshake = self.__inst.handshake
+            if handshake:
+                hs = await self._event_read()
+                if hs.rstrip() != handshake:
+                    raise RuntimeError(hs)
+
+        return resp
+
+    async def _event_read(self):
+        """
+        Reads until the read termination, or the resource stops sending,
+        using VISA asynchronous I/O.
+
+        :returns: Response from the read, without the read termination.
+        :raises VisaIOError: If the read fails.
+        """
+        visa = _pyvisa()
+        status_code = visa.constants.StatusCode
+        resource = self.__inst.instrument
+        loop = asyncio.get_running_loop()
+        data = b""
+        while True:
+            _, job_id, _ = resource.visalib.read_asynchronously(
+                resource.session, resource.chunk_size
+            )
+
+            # completion is scheduled on the loop, so can not run before this
+            job_key = _job_key(job_id)
+            future = loop.create_future()
+            self.__jobs[job_key] = future
+
+            # if cancelled the buffer is kept, as VISA may still write to it
+            status, chunk = await future
+            _release_job(resource.visalib, job_key)
+            if status < status_code.success:
+                raise visa.VisaIOError(status)
+
+            data += chunk
+            if status != status_code.success_max_count_read:
+                break
+
+        resp = data.decode(resource.encoding)
+        term = resource.read_termination
+        if term and resp.endswith(term):
+            resp = resp[: -len(term)]
+
+        return resp
+
+    async def _run(self, func, *args):
+        """
+        Runs a blocking function on the instrument's worker thread.
+
+        :param func: Function to run.
+        :param args: Arguments passed to the function.
+        :returns: Result of the function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__io_pool, func, *args)
+
+
+def _job_key(job_id):
+    """
+    :param job_id: Asynchronous job id, as an int or ctypes value.
+    :returns: Job id as an int.
+    """
+    return getattr(job_id, "value", job_id)
+
+
+def _release_job(visalib, job_id):
+    """
+    Discards the buffer of a completed asynchronous read.
+    pyvisa keeps the buffer of every read to look up its data,
+    so buffers would otherwise accumulate over a session.
+
+    :param visalib: VISA library of the resource.
+    :param job_id: Id of the completed job, as an int.
+    """
+    jobs = getattr(visalib, "_async_read_jobs", None)
+    if not jobs:
+        return
+
+    for index, (jid, _) in enumerate(jobs):
+        if _job_key(jid) == job_id:
+            del jobs[index]
+            return
+
+
+def _complete_job(jobs, job_id, status, data):
+    """
+    Resolves the future waiting on an asynchronous job.
+
+    :param jobs: Dictionary of pending jobs.
+    :param job_id: Id of the completed job.
+    :param status: Status code of the job.
+    :param data: Data read by the job.
+    """
+    future = jobs.pop(_job_key(job_id), None)
+    if future is not None and not future.done():
+        future.set_result((status, data))
+
+
+async def connect_async(*args, **kwargs):
+    """
+    Creates an asynchronous Instrument and connects to it.
+    Arguments are passed to SCPI_Instrument.
+
+    async with await connect_async(port) as inst:
+        await inst.p1.p2.p3()
+
+    :returns: A connected AsyncSCPI_Instrument.
+    """
+    inst = AsyncSCPI_Instrument(*args, **kwargs)
+    await inst.connect()
+    return inst
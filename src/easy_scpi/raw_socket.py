@@ -0,0 +1,243 @@
+import re
+import socket
+
+# TCPIP[board]::<host>::<port>::SOCKET
+_SOCKET_RID = re.compile(r"TCPIP\d*::([^:]+)::(\d+)::SOCKET$", re.IGNORECASE)
+
+
+class RawSocketResource:
+    """
+    Minimal resource communicating with a SCPI instrument over a raw TCP socket.
+    Used by the `@raw` backend in place of a pyvisa resource
+    to avoid the VISA layer for LAN instruments.
+
+    Only the parts of the pyvisa resource interface used by SCPI_Instrument
+    are provided, i.e. `open`, `close`, `write`, `read`, `query`, `read_bytes`,
+    `query_ascii_values`, and `query_binary_values`.
+    """
+
+    def __init__(self, rid, open_timeout=None):
+        """
+        Opens a socket to the instrument.
+
+        :param rid: Resource id of the form `TCPIP::<host>::<port>::SOCKET`.
+        :param open_timeout: Time to wait for the connection in ms,
+            or None to use the timeout. [Default: None]
+        :raises ValueError: If the resource id is not a TCPIP socket.
+        """
+        match = _SOCKET_RID.match(rid)
+        if match is None:
+            raise ValueError(
+                f"Raw backend requires a resource of the form "
+                f"TCPIP::<host>::<port>::SOCKET, got {rid}"
+            )
+
+        self.resource_name = rid
+        self.host = match.group(1)
+        self.port = int(match.group(2))
+        self.open_timeout = open_timeout
+
+        self.read_termination = "\n"
+        self.write_termination = "\n"
+        self.encoding = "ascii"
+        self.chunk_size = 20 * 1024
+
+        self.__timeout = 2000  # ms
+        self.__sock = None
+        self.__buffer = b""  # data received after the last termination
+        self.open()
+
+    @property
+    def timeout(self):
+        """
+        Timeout of socket operations in ms, or None for no timeout.
+        """
+        return self.__timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        """
+        :param timeout: Timeout in ms, or None for no timeout.
+        """
+        self.__timeout = timeout
+        if self.__sock is not None:
+            self.__sock.settimeout(_seconds(timeout))
+
+    @property
+    def session(self):
+        """
+        :returns: File descriptor of the socket.
+        :raises ConnectionError: If the socket is not open.
+        """
+        return self._socket().fileno()
+
+    def open(self):
+        """
+        Opens the socket.
+        """
+        if self.__sock is not None:
+            return
+
+        open_timeout = (
+            self.__timeout if self.open_timeout is None else self.open_timeout
+        )
+
+        sock = socket.create_connection(
+            (self.host, self.port), timeout=_seconds(open_timeout)
+        )
+
+        sock.settimeout(_seconds(self.__timeout))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.__sock = sock
+        self.__buffer = b""
+
+    def close(self):
+        """
+        Closes the socket.
+        """
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+
+    def write(self, msg):
+        """
+        :param msg: Message to send, the write termination is appended.
+        :returns: Number of bytes written.
+        """
+        data = (msg + self.write_termination).encode(self.encoding)
+        self._socket().sendall(data)
+        return len(data)
+
+    def read(self):
+        """
+        Reads until the read termination.
+
+        :returns: Response, without the read termination.
+        """
+        return self._read_raw().decode(self.encoding)
+
+    def read_bytes(self, count):
+        """
+        Reads an exact number of bytes.
+
+        :param count: Number of bytes to read.
+        :returns: Bytes read.
+        """
+        while len(self.__buffer) < count:
+            self.__buffer += self._recv()
+
+        data = self.__buffer[:count]
+        self.__buffer = self.__buffer[count:]
+        return data
+
+    def query(self, msg):
+        """
+        Writes a message then reads the response.
+
+        :param msg: Message to send.
+        :returns: Response.
+        """
+        self.write(msg)
+        return self.read()
+
+    def query_ascii_values(self, msg, converter="f", separator=",", container=list):
+        """
+        Writes a message, then reads the response as separated values.
+        See pyvisa's `query_ascii_values`.
+
+        :param msg: Message to send.
+        :param converter: Format character or function
+            used to convert each value. [Default: 'f']
+        :param separator: Separator between values. [Default: ',']
+        :param container: Type of the returned values. [Default: list]
+        :returns: Values of the response.
+        """
+        from pyvisa import util
+
+        return util.from_ascii_block(
+            self.query(msg),
+            converter=converter,
+            separator=separator,
+            container=container,
+        )
+
+    def query_binary_values(
+        self, msg, datatype="f", is_big_endian=False, container=list
+    ):
+        """
+        Writes a message, then reads the response as an IEEE 488.2 block.
+        See pyvisa's `query_binary_values`.
+
+        :param msg: Message to send.
+        :param datatype: struct format character of the values. [Default: 'f']
+        :param is_big_endian: Whether the values are big endian. [Default: False]
+        :param container: Type of the returned values. [Default: list]
+        :returns: Values of the response.
+        :raises ValueError: If the response is not a binary block.
+        """
+        from pyvisa import util
+
+        self.write(msg)
+        header = self.read_bytes(2)
+        if header[:1] != b"#" or not header[1:].isdigit():
+            raise ValueError(f"Expected a binary block, got {header!r}.")
+
+        digits = int(header[1:])
+        if digits == 0:
+            # indefinite length, ends at the read termination
+            block = header + self._read_raw()
+
+        else:
+            length = self.read_bytes(digits)
+            block = header + length + self.read_bytes(int(length))
+            self._read_raw()  # discard the read termination
+
+        return util.from_ieee_block(
+            block, datatype=datatype, is_big_endian=is_big_endian, container=container
+        )
+
+    def _read_raw(self):
+        """
+        Reads until the read termination.
+
+        :returns: Bytes of the response, without the read termination.
+        """
+        term = self.read_termination.encode(self.encoding)
+        while True:
+            index = self.__buffer.find(term)
+            if index >= 0:
+                data = self.__buffer[:index]
+                self.__buffer = self.__buffer[index + len(term) :]
+                return data
+
+            self.__buffer += self._recv()
+
+    def _socket(self):
+        """
+        :returns: The open socket.
+        :raises ConnectionError: If the socket is not open.
+        """
+        if self.__sock is None:
+            raise ConnectionError("Socket is not open.")
+
+        return self.__sock
+
+    def _recv(self):
+        """
+        :returns: Next chunk of data from the socket.
+        :raises ConnectionError: If the connection was closed by the instrument.
+        """
+        chunk = self._socket().recv(self.chunk_size)
+        if not chunk:
+            raise ConnectionError("Connection closed by instrument.")
+
+        return chunk
+
+
+def _seconds(timeout):
+    """
+    :param timeout: Timeout in ms, or None.
+    :returns: Timeout in seconds, or None.
+    """
+    return None if timeout is None else timeout / 1000
@@ -1,7 +1,139 @@
 import re
+import math
+import asyncio
+import time
 import platform
+import weakref
+import threading
+import functools
+from contextlib import contextmanager
 
-import pyvisa as visa
+from easy_scpi.raw_socket import RawSocketResource
+
+_IS_WINDOWS = platform.system() == "Windows"
+
+# port prefixes of resources identified by name
+_WINDOWS_PREFIXES = ("COM", "USB", "GPIB", "TCPIP")
+_LINUX_PREFIXES = ("USB", "GPIB", "TCPIP")
+
+# backend communicating directly over TCP sockets, bypassing VISA
+_RAW_BACKEND = "@raw"
+
+# seconds to reuse a listing of available resources
+_RESOURCE_CACHE_TTL = 2
+
+# pyvisa module, imported when first needed
+_visa = None
+
+# resource managers shared by instruments, keyed by backend
+_RM_CACHE = {}
+_RM_LOCK = threading.Lock()
+
+# cached (timestamp, resources) listings shared by instruments, keyed by backend
+_LIST_CACHE = {}
+
+# boolean values of standard string inputs
+_BOOL_MAP = {
+    "on": True,
+    "1": True,
+    "true": True,
+    "off": False,
+    "0": False,
+    "false": False,
+}
+
+# SCPI states of standard string inputs
+_STATE_MAP = {val: "ON" if state else "OFF" for val, state in _BOOL_MAP.items()}
+
+
+def _format_arg(value):
+    """
+    Formats a value as a SCPI argument.
+    Booleans are sent as SCPI states, other values as their string.
+
+    :param value: Value to format.
+    :returns: Formatted value.
+    """
+    value_type = type(value)
+    if value_type is str:
+        return value
+
+    if value_type is bool:
+        return "ON" if value else "OFF"
+
+    return str(value)
+
+
+def _pyvisa():
+    """
+    Imports pyvisa when first needed,
+    so importing the package does not require it.
+
+    :returns: pyvisa module.
+    """
+    global _visa
+    if _visa is None:
+        import pyvisa
+
+        _visa = pyvisa
+
+    return _visa
+
+
+def _io_errors():
+    """
+    :returns: Tuple of errors which may indicate a lost connection.
+    """
+    visa = _pyvisa()
+    return (visa.VisaIOError, visa.InvalidSession, ConnectionError)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_resource_pattern(pattern):
+    """
+    Compiles a resource pattern, reusing patterns of previous ports.
+
+    :param pattern: Resource pattern.
+    :returns: Case insensitive compiled pattern.
+    """
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _subsystem(msg):
+    """
+    Gets the root subsystem of a SCPI message.
+    e.g. `:SOUR:VOLT 1` -> `SOUR`, `FREQ?` -> `FREQ`
+
+    :param msg: SCPI message.
+    :returns: Upper case root mnemonic of the message.
+    """
+    root = msg.lstrip(":").split(":", 1)[0].split(" ", 1)[0]
+    return root.rstrip("?").upper()
+
+
+def _rooted(msg):
+    """
+    Prefixes a command with a colon so it is sent from the root
+    of the command tree, unless it already is or is a common command.
+
+    :param msg: SCPI message.
+    :returns: Message from the root.
+    """
+    return msg if msg.startswith((":", "*")) else ":" + msg
+
+
+def _declare_tree(prop, spec):
+    """
+    Builds the child properties of a property or instrument.
+
+    :param prop: Property or instrument to build from.
+    :param spec: Nested dict of child command names, or None.
+    """
+    if not spec:
+        return
+
+    for name, children in spec.items():
+        _declare_tree(getattr(prop, name), children)
 
 
 class Property(object):
@@ -9,6 +141,16 @@ class Property(object):
     Represents a SCPI property of the instrument
     """
 
+    __slots__ = (
+        "_Property__inst",
+        "_Property__children",
+        "name",
+        "arg_separator",
+        "_query",
+        "_query_prefix",
+        "_write_prefix",
+    )
+
     ON = "ON"
     OFF = "OFF"
 
@@ -17,54 +159,92 @@ class Property(object):
         Represents a call to a SCPI instrument's proeprty or method.
 
         :param inst: A SCPI instrument resource.
+            Only a weak reference is kept, so cached properties
+            do not keep the instrument alive.
         :param name: Name of the property.
             Used to recursively build the property call message.
         :param arg_separator: Separator to use to separate
             methos arguments in a method call.
             [Default: ',']
         """
+        if not isinstance(inst, weakref.ProxyTypes):
+            inst = weakref.proxy(inst)
+
         self.__inst = inst
-        self.name = name.upper()
+        self.__children = {}  # cache of child properties
+        self.name = name if name.isupper() else name.upper()
         self.arg_separator = arg_separator
 
+        # precomputed messages
+        self._query = self.name + "?"
+        self._query_prefix = self.name + "? "
+        self._write_prefix = self.name + " "
+
     def __getattr__(self, name):
-        return Property(
-            self.__inst,
-            ":".join((self.name, name.upper())),
-            arg_separator=self.arg_separator,
-        )
+        if name.startswith("_"):
+            # private and special attributes are never SCPI commands
+            raise AttributeError(name)
+
+        child = self.__children.get(name)
+        if child is None:
+            child = Property(
+                self.__inst,
+                self.name + ":" + name,  # upper cased by the child
+                arg_separator=self.arg_separator,
+            )
+            self.__children[name] = child
 
-    def __call__(self, *values, query=None):
+        return child
+
+    def __call__(self, *values, query=None, binary=False):
         """
         Calls a SCPI command. If no values are passed it acts as a query 'COMMand?'
         If values are passed it acts as a write 'COMMand [values]'.
+        Boolean values are sent as 'ON' or 'OFF'.
         For queries that require arguments, `query=True` can be passed.
         Alternatively for writes that need no arguments, `query=False` can be passed.
+        For queries returning a binary block, `binary=True` can be passed.
+        [See SCPI_Instrument#query_binary_values.]
         """
-        args_passed = len(values) > 0
-        args = " " + self.arg_separator.join(map(str, values)) if args_passed else ""
-        query = (not args_passed) if query is None else query
+        if not values:
+            if binary:
+                return self.__inst.query_binary_values(self._query)
+
+            if query is False:
+                return self.__inst.write(self.name)
+
+            return self.__inst.query(self._query)
+
+        if len(values) == 1:
+            args = _format_arg(values[0])
+            if not args and not (query or binary):
+                # command without arguments, e.g. `inst.init('')`
+                return self.__inst.write(self.name)
+
+        else:
+            args = self.arg_separator.join(map(_format_arg, values))
+
+        if binary:
+            return self.__inst.query_binary_values(self._query_prefix + args)
+
         if query:
-            return self.__inst.query(self.name + "?" + args)
+            return self.__inst.query(self._query_prefix + args)
         else:
-            return self.__inst.write(self.name + args)
+            return self.__inst.write(self._write_prefix + args)
 
     @staticmethod
     def val2bool(val):
         """
         Converts standard input to boolean values
 
-        True:  'on',  '1', 1, True
-        False: 'off', '0', 0, False
+        True:  'on',  '1', 'true',  1, True
+        False: 'off', '0', 'false', 0, False
         """
         if isinstance(val, str):
-            val = val.lower()
-            if val == "on" or val == "1":
-                return True
-            elif val == "off" or val == "0":
-                return False
-            else:
-                raise ValueError("Invalid input")
+            try:
+                return _BOOL_MAP[val.lower()]
+            except KeyError:
+                raise ValueError("Invalid input") from None
 
         return bool(val)
 
@@ -73,14 +253,16 @@ class Property(object):
         """
         Converts standard input to SCPI state
 
-        ON:  True,  '1', 1, 'on',  'ON'
-        OFF: False, '0', 0, 'off', 'OFF'
+        ON:  True,  '1', 1, 'on',  'ON',  'true'
+        OFF: False, '0', 0, 'off', 'OFF', 'false'
         """
-        state = Property.val2bool(val)
-        if state:
-            return "ON"
-        else:
-            return "OFF"
+        if isinstance(val, str):
+            try:
+                return _STATE_MAP[val.lower()]
+            except KeyError:
+                raise ValueError("Invalid input") from None
+
+        return "ON" if val else "OFF"
 
 
 class SCPI_Instrument:
@@ -95,6 +277,27 @@ class SCPI_Instrument:
     To execute a command: inst.p1.p2.p3( '' )
     """
 
+    __slots__ = (
+        "_SCPI_Instrument__backend",
+        "_SCPI_Instrument__inst",
+        "_SCPI_Instrument__connected",
+        "_SCPI_Instrument__port",
+        "_SCPI_Instrument__port_match",
+        "_SCPI_Instrument__rid",
+        "_SCPI_Instrument__cache_policy",
+        "_SCPI_Instrument__query_cache",
+        "_SCPI_Instrument__group",
+        "_SCPI_Instrument__io_lock",
+        "_SCPI_Instrument__resource_params",
+        "_SCPI_Instrument__prop_cache",
+        "_SCPI_Instrument__arg_separator",
+        "_SCPI_Instrument__prefix_cmds",
+        "remote_on_connect",
+        "supports_compound",
+        "_SCPI_Instrument__handshake",
+        "__weakref__",
+    )
+
     def __init__(
         self,
         port=None,
@@ -103,6 +306,8 @@ class SCPI_Instrument:
         handshake=False,
         arg_separator=",",
         prefix_cmds=False,
+        remote_on_connect=True,
+        supports_compound=True,
         **resource_params,
     ):
         """
@@ -110,46 +315,82 @@ class SCPI_Instrument:
 
         :param port: The name of the port to connect to. [Default: None]
         :param port_match: Verify the port is associated to a resource when connecting.
-        :param backend: The pyvisa backend to use for communication. [Default: '']
+        :param backend: The pyvisa backend to use for communication.
+            Use '@raw' to communicate with `TCPIP::<host>::<port>::SOCKET`
+            resources directly over a TCP socket, bypassing VISA. [Default: '']
         :param handshake: Handshake mode. [Default: False]
         :param arg_separator: Separator to use between arguments. [Default: ',']
         :param prefix_cmds: Option to prefix all commands with a colon. [Default: False]
+        :param remote_on_connect: Query the instrument's id when connecting
+            to place it in remote control. [Default: True]
+        :param supports_compound: Whether the instrument accepts multiple commands
+            in one message, joined with `;`. If False, #write_many and #query_many
+            send each message separately, so their commands must be fully
+            qualified, e.g. `SOUR:CURR 0.1` instead of `CURR 0.1`. [Default: True]
         :param resource_params: Arguments sent to the resource upon connection.
             https://pyvisa.readthedocs.io/en/latest/api/resources.html
         :returns: An Instrument communicator.
         """
         self.__backend = backend
-        self.__rm = visa.ResourceManager(backend)
         self.__inst = None
+        self.__connected = False
         self.__port = None
         self.__port_match = port_match
         self.__rid = None  # the resource id of the instrument
+        self.__cache_policy = {"*IDN?": math.inf}  # query cache lifetimes
+        self.__query_cache = {}  # cached (timestamp, response) of queries
+        self.__group = None  # buffered commands of an active command group
+        self.__io_lock = threading.RLock()  # serializes communication
         self.__resource_params = resource_params  # options for connection
+        self.__prop_cache = {}  # cache of root properties
 
         self.port = port
         self.arg_separator = arg_separator
         self.prefix_cmds = prefix_cmds
-
-        if handshake is True:
-            handshake = "OK"
-
+        self.remote_on_connect = remote_on_connect
+        self.supports_compound = supports_compound
         self.handshake = handshake
 
     def __del__(self):
         """
         Disconnects and deletes the Instrument
         """
-        if self.connected:
-            self.disconnect()
-
-        del self.__inst
-        del self.__rm
+        # attributes may be missing if __init__ failed
+        inst = getattr(self, "_SCPI_Instrument__inst", None)
+        if inst is not None:
+            try:
+                inst.close()
+            except Exception:
+                # resource may already be closed or interpreter shutting down
+                pass
 
     def __getattr__(self, name):
-        resp = Property(
-            self, self.prefix_cmds * ":" + name, arg_separator=self.arg_separator
-        )
-        return resp
+        if name.startswith("_"):
+            # private and special attributes are never SCPI commands
+            raise AttributeError(name)
+
+        prop = self.__prop_cache.get(name)
+        if prop is None:
+            prop = Property(
+                self, self.prefix_cmds * ":" + name, arg_separator=self.arg_separator
+            )
+            self.__prop_cache[name] = prop
+
+        return prop
+
+    def declare_tree(self, spec):
+        """
+        Builds the properties of a known command tree up front,
+        so accessing them only retrieves the existing properties.
+        Useful in the initialization of instrument specific subclasses.
+        Changing `arg_separator` or `prefix_cmds` discards declared properties.
+
+        inst.declare_tree({'meas': {'volt': {'dc': None}, 'curr': None}})
+
+        :param spec: Nested dict of command names,
+            with None for commands without children.
+        """
+        _declare_tree(self, spec)
 
     def __enter__(self):
         self.connect()
@@ -162,6 +403,55 @@ class SCPI_Instrument:
     def backend(self):
         return self.__backend
 
+    @property
+    def handshake(self):
+        """
+        Handshake message expected after each command,
+        or False if handshaking is disabled.
+        """
+        return self.__handshake
+
+    @handshake.setter
+    def handshake(self, handshake):
+        """
+        :param handshake: Handshake message, True to use 'OK',
+            or False to disable handshaking.
+        """
+        if handshake is True:
+            handshake = "OK"
+
+        self.__handshake = handshake
+
+    @property
+    def arg_separator(self):
+        """
+        Separator to use between arguments.
+        """
+        return self.__arg_separator
+
+    @arg_separator.setter
+    def arg_separator(self, arg_separator):
+        """
+        :param arg_separator: Separator to use between arguments.
+        """
+        self.__arg_separator = arg_separator
+        self.__prop_cache.clear()
+
+    @property
+    def prefix_cmds(self):
+        """
+        Prefix all commands with a colon.
+        """
+        return self.__prefix_cmds
+
+    @prefix_cmds.setter
+    def prefix_cmds(self, prefix_cmds):
+        """
+        :param prefix_cmds: Whether to prefix all commands with a colon.
+        """
+        self.__prefix_cmds = prefix_cmds
+        self.__prop_cache.clear()
+
     @property
     def instrument(self):
         return self.__inst
@@ -178,17 +468,22 @@ class SCPI_Instrument:
 
         :param port: The port to connect to.
         """
+        # responses may be from a different instrument
+        self.__query_cache.clear()
+
         if port is None:
             self.__port = None
             self.__rid = None
             return
 
-        system = platform.system()
-        if system == "Windows":
-            self._set_port_windows(port, match=self.port_match)
+        # raw sockets can not be listed
+        match = self.port_match and self.__backend != _RAW_BACKEND
+
+        if _IS_WINDOWS:
+            self._set_port_windows(port, match=match)
 
         else:
-            self._set_port_linux(port, match=self.port_match)
+            self._set_port_linux(port, match=match)
 
     @property
     def port_match(self):
@@ -222,13 +517,46 @@ class SCPI_Instrument:
     def resource_params(self):
         return self.__resource_params
 
+    @property
+    def cache_policy(self):
+        """
+        Mapping of query messages to the number of seconds
+        their response may be reused.
+        Messages not in the policy are never cached.
+        By default only `*IDN?` is cached, indefinitely.
+
+        The cache is cleared when connecting or disconnecting,
+        and a write clears cached queries of the same subsystem,
+        e.g. `FREQ 1` clears `FREQ?`.
+        Messages must match exactly, so use consistent command forms.
+        """
+        return self.__cache_policy
+
+    def clear_cache(self):
+        """
+        Clears all cached query responses.
+        """
+        self.__query_cache.clear()
+
     @property
     def id(self):
         """
         Returns the id of the instrument.
+        The id is cached after it is first queried.
         """
         return self.query("*IDN?")
 
+    def force_id(self):
+        """
+        Queries the id of the instrument, ignoring any cached id.
+
+        :returns: Id of the instrument.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        with self.__io_lock:
+            self.__query_cache.pop("*IDN?", None)
+            return self.query("*IDN?")
+
     @property
     def value(self):
         """
@@ -240,6 +568,23 @@ class SCPI_Instrument:
     def connected(self):
         """
         Returns if the instrument is connected.
+        Tracks calls to #connect and #disconnect, and lost connections,
+        use #is_alive to check the session itself.
+        """
+        return self.__connected and self.__inst is not None
+
+    @property
+    def is_connected(self):
+        """
+        Alias for connected.
+        """
+        return self.connected
+
+    def is_alive(self):
+        """
+        Checks if the resource session is valid.
+
+        :returns: If the session is valid.
         """
         if self.__inst is None:
             return False
@@ -248,16 +593,9 @@ class SCPI_Instrument:
             # session throws excpetion if not connected
             self.__inst.session
             return True
-        except visa.InvalidSession:
+        except (_pyvisa().InvalidSession, ConnectionError):
             return False
 
-    @property
-    def is_connected(self):
-        """
-        Alias for connected.
-        """
-        return self.connected
-
     def connect(self):
         """
         Connects to the instrument on the given port.
@@ -266,21 +604,36 @@ class SCPI_Instrument:
             raise RuntimeError("Can not connect. No resource id provided.")
 
         if self.__inst is None:
-            self.__inst = self.__rm.open_resource(self.rid)
+            params = self.__resource_params
+            open_kwargs = {}
+            if "open_timeout" in params:
+                # only used while opening, not a resource attribute
+                open_kwargs["open_timeout"] = params["open_timeout"]
+
+            if self.__backend == _RAW_BACKEND:
+                self.__inst = RawSocketResource(self.rid, **open_kwargs)
+            else:
+                self.__inst = self._rm().open_resource(self.rid, **open_kwargs)
 
             # set resource parameters
-            for param, val in self.__resource_params.items():
-                setattr(self.__inst, param, val)
+            for param, val in params.items():
+                if param != "open_timeout":
+                    setattr(self.__inst, param, val)
 
         else:
             self.__inst.open()
 
-        self.id  # place instrument in remote control
+        self.__connected = True
+        self.__query_cache.clear()
+        if self.remote_on_connect:
+            self.query("*IDN?")  # place instrument in remote control
 
     def disconnect(self):
         """
         Disconnects from the instrument, and returns local control.
         """
+        self.__connected = False
+        self.__query_cache.clear()
         if self.__inst is not None:
             self.__inst.close()
 
@@ -295,8 +648,14 @@ class SCPI_Instrument:
         if self.__inst is None:
             raise RuntimeError("Can not write, instrument not connected.")
 
-        resp = self.__inst.write(msg)
-        self._handle_handshake()
+        with self.__io_lock:
+            if self.__group is not None:
+                self.__group.append(_rooted(msg))
+                return None
+
+            resp = self._write(msg)
+            if self.__handshake:
+                self._handle_handshake()
 
         return resp
 
@@ -307,10 +666,17 @@ class SCPI_Instrument:
         :returns: Response from the read.
         :raises RuntimeError: If an instrument is not connected.
         """
-        if self.__inst is None:
+        inst = self.__inst
+        if inst is None:
             raise RuntimeError("Can not read, instrument not connected")
 
-        resp = self.__inst.read()
+        with self.__io_lock:
+            try:
+                resp = inst.read()
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
         return resp
 
     def query(self, msg):
@@ -321,13 +687,335 @@ class SCPI_Instrument:
         :returns: Response from the message.
         :raises RuntimeError: If an instrument is not connected.
         """
-        if self.__inst is None:
+        inst = self.__inst
+        if inst is None:
             raise RuntimeError("Can not query, instrument not connected")
 
-        resp = self.__inst.query(msg)
-        self._handle_handshake()
+        with self.__io_lock:
+            if self.__group is not None:
+                raise RuntimeError("Can not query inside a command group.")
+
+            ttl = self.__cache_policy.get(msg)
+            if ttl:
+                cached = self.__query_cache.get(msg)
+                if cached is not None and time.monotonic() - cached[0] < ttl:
+                    return cached[1]
+
+            elif self.__query_cache and "?" not in msg:
+                # setting a value
+                self._invalidate_cache(msg)
+
+            # hold the lock until the handshake is read
+            try:
+                resp = inst.query(msg)
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
+            if self.__handshake:
+                self._handle_handshake()
+
+            if ttl:
+                self.__query_cache[msg] = (time.monotonic(), resp)
+
+        return resp
+
+    def query_binary_values(
+        self, msg, datatype="f", is_big_endian=False, container=list
+    ):
+        """
+        Delegates binary query to resource.
+        Reads the response as an IEEE 488.2 definite length block,
+        avoiding ASCII formatting and parsing of large data sets,
+        e.g. `CURVe?` (Tektronix) or `FETCh:ARRay?` (Keithley).
+
+        :param msg: Message to send.
+        :param datatype: struct format character of the values. [Default: 'f']
+        :param is_big_endian: Whether the values are big endian. [Default: False]
+        :param container: Type of the returned values,
+            e.g. `numpy.array`. [Default: list]
+        :returns: Values of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        inst = self.__inst
+        if inst is None:
+            raise RuntimeError("Can not query, instrument not connected")
+
+        with self.__io_lock:
+            if self.__group is not None:
+                raise RuntimeError("Can not query inside a command group.")
+
+            try:
+                resp = inst.query_binary_values(
+                    msg,
+                    datatype=datatype,
+                    is_big_endian=is_big_endian,
+                    container=container,
+                )
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
+            if self.__handshake:
+                self._handle_handshake()
+
+        return resp
+
+    def query_ascii_values(self, msg, converter="f", separator=",", container=list):
+        """
+        Delegates ASCII values query to resource.
+        Reads a block of separated values in a single query,
+        e.g. the points of a sweep from `READ?` or `TRACe:DATA?`,
+        instead of querying each point.
+
+        :param msg: Message to send.
+        :param converter: Format character or function
+            used to convert each value. [Default: 'f']
+        :param separator: Separator between values. [Default: ',']
+        :param container: Type of the returned values,
+            e.g. `numpy.array`. [Default: list]
+        :returns: Values of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        inst = self.__inst
+        if inst is None:
+            raise RuntimeError("Can not query, instrument not connected")
+
+        with self.__io_lock:
+            if self.__group is not None:
+                raise RuntimeError("Can not query inside a command group.")
+
+            try:
+                resp = inst.query_ascii_values(
+                    msg,
+                    converter=converter,
+                    separator=separator,
+                    container=container,
+                )
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
+            if self.__handshake:
+                self._handle_handshake()
+
         return resp
 
+    def query_raw(self, msg, count):
+        """
+        Writes a message, then reads an exact number of bytes.
+        Avoids scanning for the read termination and decoding the response,
+        for responses of known length, e.g. fixed width readings.
+        The read termination is not removed, so should be included in `count`
+        unless it is read separately.
+
+        :param msg: Message to send.
+        :param count: Number of bytes to read.
+        :returns: Bytes of the response.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        inst = self.__inst
+        if inst is None:
+            raise RuntimeError("Can not query, instrument not connected")
+
+        with self.__io_lock:
+            if self.__group is not None:
+                raise RuntimeError("Can not query inside a command group.")
+
+            try:
+                inst.write(msg)
+                resp = inst.read_bytes(count)
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
+            if self.__handshake:
+                self._handle_handshake()
+
+        return resp
+
+    def write_many(self, *msgs, handshake_per_command=False):
+        """
+        Sends multiple commands as a single compound message,
+        joined with `;`.
+        Commands after the first are relative to the subsystem of the
+        preceding command unless prefixed with a colon,
+        e.g. `write_many('SOUR:VOLT 1', 'CURR 0.1', ':OUTP ON')`.
+        If `supports_compound` is disabled each command is sent separately,
+        so relative commands are not resolved and must be fully qualified.
+
+        :param msgs: Messages to send.
+        :param handshake_per_command: Read a handshake for each command
+            instead of a single one for the whole message. [Default: False]
+        :returns: Response from the message,
+            or from the last message if compound messages are not supported.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        if not msgs:
+            return None
+
+        inst = self.__inst
+        if inst is None:
+            raise RuntimeError("Can not write, instrument not connected.")
+
+        with self.__io_lock:
+            if self.__group is not None:
+                # later commands stay relative to the first
+                self.__group.append(_rooted(msgs[0]))
+                self.__group.extend(msgs[1:])
+                return None
+
+            # relative commands make subsystems ambiguous
+            self.__query_cache.clear()
+
+            if not self.supports_compound:
+                for msg in msgs:
+                    try:
+                        resp = inst.write(msg)
+                    except _io_errors() as err:
+                        self._handle_io_error(err)
+                        raise
+
+                    self._handle_handshake()
+
+                return resp
+
+            try:
+                resp = inst.write(";".join(msgs))
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+            for _ in range(len(msgs) if handshake_per_command else 1):
+                self._handle_handshake()
+
+        return resp
+
+    def query_many(self, *msgs):
+        """
+        Sends multiple queries as a single compound message,
+        joined with `;`, and splits the response.
+        As with #write_many, queries after the first are relative
+        to the subsystem of the preceding query unless prefixed with a colon,
+        e.g. `query_many('MEAS:VOLT?', ':MEAS:CURR?')`.
+        Unlike a #command_group, no colon is added to the first query.
+        Responses containing `;` can not be split correctly,
+        and some instruments do not accept compound queries,
+        in which case `supports_compound` should be disabled
+        to query each message separately,
+        and queries must be fully qualified.
+
+        :param msgs: Messages to send.
+        :returns: List of responses, one for each message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        if not self.supports_compound:
+            with self.__io_lock:
+                return [self.query(msg) for msg in msgs]
+
+        resp = self.query(";".join(msgs))
+        return resp.split(";")
+
+    async def awrite(self, msg):
+        """
+        Writes from a worker thread, so the event loop is not blocked.
+        See #write.
+        Use an AsyncInstrument to avoid the thread overhead
+        of each call when communicating asynchronously throughout.
+
+        Inside a command group the message is buffered
+        without waiting for a worker thread.
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        if self._in_group():
+            # the group holds the I/O lock on this thread
+            return self.write(msg)
+
+        return await asyncio.to_thread(self.write, msg)
+
+    async def aread(self):
+        """
+        Reads from a worker thread, so the event loop is not blocked.
+        See #read.
+
+        :returns: Response from the read.
+        :raises RuntimeError: If an instrument is not connected,
+            or inside a command group.
+        """
+        if self._in_group():
+            raise RuntimeError("Can not read inside a command group.")
+
+        return await asyncio.to_thread(self.read)
+
+    async def aquery(self, msg):
+        """
+        Queries from a worker thread, so the event loop is not blocked.
+        The write and read of the query can not be interleaved
+        with other communication. See #query.
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected,
+            or inside a command group.
+        """
+        if self._in_group():
+            raise RuntimeError("Can not query inside a command group.")
+
+        return await asyncio.to_thread(self.query, msg)
+
+    @contextmanager
+    def command_group(self, handshake_per_command=False):
+        """
+        Groups commands into a single compound message.
+        Writes inside the group, including property calls, are buffered
+        and sent with #write_many when the group exits without error.
+        Commands are sent from the root of the command tree,
+        so they do not need to share a subsystem.
+        Commands of a #write_many call keep their relative paths,
+        only the first is sent from the root.
+        Queries can not be made inside a group, and nested groups
+        are merged into the outermost one.
+        Other threads can not communicate with the instrument
+        until the group is sent.
+
+        with inst.command_group():
+            inst.source.voltage(1)
+            inst.output.state('ON')
+
+        :param handshake_per_command: Read a handshake for each command
+            instead of a single one for the whole group. [Default: False]
+        :raises RuntimeError: If a query is made inside the group.
+        """
+        with self.__io_lock:
+            if self.__group is not None:
+                yield
+                return
+
+            group = self.__group = []
+            try:
+                yield
+
+            finally:
+                self.__group = None
+
+            self.write_many(*group, handshake_per_command=handshake_per_command)
+
+    def batch(self, handshake_per_command=False):
+        """
+        Alias for command_group.
+        """
+        return self.command_group(handshake_per_command=handshake_per_command)
+
+    def refresh_resources(self):
+        """
+        Discards cached listings of available resources,
+        so the next port change lists them again.
+        Listings are shared by all instruments using the same backend.
+        """
+        _LIST_CACHE.pop(self.__backend, None)
+
     def reset(self):
         """
         Resets the meter to inital state.
@@ -346,15 +1034,87 @@ class SCPI_Instrument:
         """
         return self.write("INIT")
 
+    def _write(self, msg):
+        """
+        Writes to the resource without buffering or handshaking.
+        Invalidates affected cached queries and tracks lost connections.
+
+        :param msg: Message to send.
+        :returns: Response from the message.
+        :raises RuntimeError: If an instrument is not connected.
+        """
+        inst = self.__inst
+        if inst is None:
+            raise RuntimeError("Can not write, instrument not connected.")
+
+        with self.__io_lock:
+            if self.__query_cache:
+                self._invalidate_cache(msg)
+
+            try:
+                resp = inst.write(msg)
+            except _io_errors() as err:
+                self._handle_io_error(err)
+                raise
+
+        return resp
+
+    def _in_group(self):
+        """
+        :returns: If a command group is active on the current thread.
+        """
+        # fails only if another thread holds the lock
+        if not self.__io_lock.acquire(blocking=False):
+            return False
+
+        try:
+            return self.__group is not None
+        finally:
+            self.__io_lock.release()
+
+    def _handle_io_error(self, err):
+        """
+        Marks the instrument as disconnected if the connection was lost.
+        Other errors, e.g. timeouts, do not change the connection state.
+
+        :param err: Error raised by the resource.
+        """
+        visa = _pyvisa()
+        if (
+            isinstance(err, visa.VisaIOError)
+            and err.error_code != visa.constants.StatusCode.error_connection_lost
+        ):
+            return
+
+        self.__connected = False
+
+    def _invalidate_cache(self, msg):
+        """
+        Removes cached queries affected by a command.
+        Common commands, e.g. `*RST`, and compound commands clear the whole cache,
+        other commands clear cached queries of the same subsystem.
+
+        :param msg: Command being sent.
+        """
+        subsystem = _subsystem(msg)
+        if subsystem.startswith("*") or ";" in msg:
+            self.__query_cache.clear()
+            return
+
+        for cached in [m for m in self.__query_cache if _subsystem(m) == subsystem]:
+            del self.__query_cache[cached]
+
     def _handle_handshake(self):
         """
         Handles handshaking if enabled.
+        Trailing whitespace of the response is ignored,
+        e.g. a carriage return left by a `\n` read termination.
 
         :raises RuntimeError: If the response message does not match the handshake message.
         """
-        if self.handshake:
+        if self.__handshake:
             hs = self.read()
-            if hs != self.handshake:
+            if hs.rstrip() != self.__handshake:
                 raise RuntimeError(hs)
 
     def _set_port_windows(self, port, match=True):
@@ -366,34 +1126,31 @@ class SCPI_Instrument:
         :param match: Whether to verify the port matches a resource. [Default: True]
         :raises ValueError: If connection type is not specified.
         """
-        prefixes = ["COM", "USB", "GPIB", "TCPIP"]
         port_name = port.upper()
-
-        if not any(port_name.startswith(p) for p in prefixes):
-            raise ValueError(f"Port must start with one of the following: {prefixes}.")
+        if not port_name.startswith(_WINDOWS_PREFIXES):
+            raise ValueError(
+                f"Port must start with one of the following: {_WINDOWS_PREFIXES}."
+            )
 
         if self.__inst is not None:
             self.disconnect()
+            self.__inst = None  # open the new resource when connecting
 
         self.__port = port
 
         # search for resource
-        if any(port_name.startswith(p) for p in prefixes[1:]):
+        if port_name.startswith("COM"):
+            r_port = port[3:]
+            resource_pattern = f"ASRL((?:COM)?{r_port})::INSTR"
+
+        else:
             # connections except com
             resource_pattern = (
                 port
-                if port_name.endswith("INSTR") or port_name.endswith("SOCKET")
+                if port_name.endswith(("INSTR", "SOCKET"))
                 else f"{ port }::.*::INSTR"
             )
 
-        elif port_name.startswith("COM"):
-            r_port = port.replace("COM", "")
-            resource_pattern = f"ASRL((?:COM)?{r_port})::INSTR"
-
-        else:
-            # redundant error check for future compatibility
-            raise ValueError(f"Port must start with one of the following: {prefixes}.")
-
         # single matching resource
         resource = self._match_resource(resource_pattern) if match else resource_pattern
         self.__rid = resource
@@ -406,19 +1163,19 @@ class SCPI_Instrument:
         :param port: Name of port to connect to.
         :param match: Whether to verify the port matches a resource. [Default: True]
         """
-        prefixes = ["USB", "GPIB", "TCPIP"]
         port_name = port.upper()
 
         if self.__inst is not None:
             self.disconnect()
+            self.__inst = None  # open the new resource when connecting
 
         self.__port = port
 
         # search for resource
-        if any(port_name.startswith(p) for p in prefixes):
+        if port_name.startswith(_LINUX_PREFIXES):
             resource_pattern = (
                 port
-                if port_name.endswith("INSTR") or port_name.endswith("SOCKET")
+                if port_name.endswith(("INSTR", "SOCKET"))
                 else f"{ port }::.*::INSTR"
             )
         else:
@@ -437,24 +1194,67 @@ class SCPI_Instrument:
         resource = self._match_resource(resource_pattern) if match else resource_pattern
         self.__rid = resource
 
-    def _match_resource(self, resource):
+    def _match_resource(self, resource, refresh=False):
         """
         Matches port name with a resource.
+        If no resource matches a cached listing, resources are listed again.
 
         :param resource: Resource name.
+        :param refresh: Ignore any cached listing of resources. [Default: False]
         :returns: Resource name.
         :raises RuntimeError: If 0 or more than 1 matching resource is found.
         """
-        rm = visa.ResourceManager(self.backend)
-        matches = [
-            re.match(resource, res, re.IGNORECASE) for res in rm.list_resources()
-        ]
+        pattern = _compile_resource_pattern(resource)
+        resources, cached = self._list_resources(refresh=refresh)
+        matches = []
+        for res in resources:
+            match = pattern.match(res)
+            if match is not None:
+                matches.append(match)
+                if len(matches) > 1:
+                    raise RuntimeError(f"Found multiple resources matching {resource}")
 
-        matches = [match for match in matches if match is not None]
         if len(matches) == 0:
+            if cached:
+                # resource may have been added since the listing
+                return self._match_resource(resource, refresh=True)
+
             raise RuntimeError(f"Could not find resource {resource}")
-        elif len(matches) > 1:
-            raise RuntimeError(f"Found multiple resources matching {resource}")
 
         r_name = matches[0].group(0)
         return r_name
+
+    def _rm(self):
+        """
+        Gets the resource manager for the instrument's backend.
+        Resource managers are created when first needed
+        and shared between instruments using the same backend.
+
+        :returns: pyvisa ResourceManager.
+        """
+        with _RM_LOCK:
+            rm = _RM_CACHE.get(self.__backend)
+            if rm is None:
+                rm = _pyvisa().ResourceManager(self.__backend)
+                _RM_CACHE[self.__backend] = rm
+
+        return rm
+
+    def _list_resources(self, refresh=False):
+        """
+        Lists the resources available to the resource manager.
+        A listing is reused for a short time by all instruments
+        using the same backend, so setting up several instruments
+        or changing ports does not rescan all buses.
+
+        :param refresh: Ignore any cached listing. [Default: False]
+        :returns: Tuple of (resource names, whether the listing was cached).
+        """
+        now = time.monotonic()
+        cached = _LIST_CACHE.get(self.__backend)
+        if not refresh and cached is not None and now - cached[0] < _RESOURCE_CACHE_TTL:
+            return cached[1], True
+
+        resources = tuple(self._rm().list_resources())
+        _LIST_CACHE[self.__backend] = (now, resources)
+        return resources, False
@@ -1,24 +1,81 @@
+import asyncio
+import ctypes
+import gc
+import math
 import platform
+import socket
+import struct
+import threading
 import pytest
+import pyvisa
 import easy_scpi as scpi
 import pathlib
 
+MOCK_INSTRUMENT = dict(
+    port="TCPIP::0.0.0.1::3000::SOCKET",
+    port_match=False,
+    read_termination="\n",
+    write_termination="\n",
+    backend=str((pathlib.Path(__file__).parent /'instrument_mock.yaml@sim').resolve()),
+)
+
 @pytest.fixture
 def blank_inst():
     # Blank Instrument
     return scpi.Instrument()
 
+class StubResource:
+    # Records calls made to the resource.
+    def __init__(self):
+        self.calls = []
+        self.response = "stub"
+
+    def write(self, msg):
+        self.calls.append(("write", msg))
+        return len(msg)
+
+    def query_binary_values(self, msg, **kwargs):
+        self.calls.append(("query_binary_values", msg, kwargs))
+        return []
+
+    def open(self):
+        self.calls.append(("open",))
+
+    def close(self):
+        self.calls.append(("close",))
+
+    def query(self, msg):
+        self.calls.append(("query", msg))
+        return "stub"
+
+    def read(self):
+        self.calls.append(("read",))
+        return self.response
+
+class LostResource:
+    # Resource whose session has been lost.
+    def close(self):
+        raise pyvisa.InvalidSession()
+
+    def write(self, msg):
+        raise pyvisa.InvalidSession()
+
+    def query_binary_values(self, msg, **kwargs):
+        raise pyvisa.InvalidSession()
+
 @pytest.fixture
+def stub_inst():
+    inst = scpi.Instrument()
+    inst._SCPI_Instrument__inst = StubResource()
+    return inst
+
+@pytest.fixture(scope="module")
 def inst():
-    inst = scpi.Instrument(
-        port="TCPIP::0.0.0.1::3000::SOCKET",
-        port_match=False,
-        read_termination="\n",
-        write_termination="\n",
-        backend=str((pathlib.Path(__file__).parent /'instrument_mock.yaml@sim').resolve()),
-    )
+    # Shared connection, tests must restore any settings they change.
+    inst = scpi.Instrument(**MOCK_INSTRUMENT)
     inst.connect()
-    return inst
+    yield inst
+    inst.disconnect()
 
 def test_property_syntax(blank_inst):
     # Assert naming conventions work as expected.
@@ -33,6 +90,18 @@ def test_prefix_syntax(blank_inst):
     assert blank_inst.a.b.name == ":A:B"
     assert blank_inst.a.b.c.name == ":A:B:C"
 
+def test_empty_argument(inst):
+    # Assert commands without arguments are sent without a trailing space.
+    inst.trig("")
+    assert inst.read() == "OK"
+
+def test_val2state():
+    assert scpi.Property.val2state("on") == "ON"
+    assert scpi.Property.val2state("True") == "ON"
+    assert scpi.Property.val2state(0) == "OFF"
+    with pytest.raises(ValueError):
+        scpi.Property.val2state("maybe")
+
 def test_easy_scpi(inst):
     assert inst.id == "mock instrument"
     
@@ -49,4 +118,321 @@ def test_argument_query(inst):
     assert inst.query('FREQ? MAX') == "100000.00"
     assert inst.freq('MAX', query=True) == "100000.00"
     assert inst.query('FREQ? MIN') == "1.00"
-    assert inst.freq('MIN', query=True) == "1.00"
\ No newline at end of file
+    assert inst.freq('MIN', query=True) == "1.00"
+
+def test_connected():
+    inst = scpi.Instrument(**MOCK_INSTRUMENT)
+    assert not inst.connected
+    inst.connect()
+    assert inst.connected
+    inst.disconnect()
+    assert not inst.connected
+    assert not inst.is_alive()
+
+def test_bool_argument(stub_inst):
+    # Assert booleans are sent as SCPI states.
+    stub_inst.outp(True)
+    stub_inst.outp(False)
+    assert stub_inst.instrument.calls == [("write", "OUTP ON"), ("write", "OUTP OFF")]
+
+def test_binary_query(stub_inst):
+    # Assert binary property calls query binary values.
+    assert stub_inst.curv(binary=True) == []
+    assert stub_inst.curv(1, 2, binary=True) == []
+    options = dict(datatype="f", is_big_endian=False, container=list)
+    assert stub_inst.instrument.calls == [
+        ("query_binary_values", "CURV?", options),
+        ("query_binary_values", "CURV? 1,2", options),
+    ]
+
+def test_lost_connection(stub_inst):
+    # Assert lost sessions clear the connected flag.
+    for send in (
+        lambda: stub_inst.write("FREQ 1"),
+        lambda: stub_inst.write_many("FREQ 1", "OUTP ON"),
+        lambda: stub_inst.query_binary_values("CURV?"),
+    ):
+        stub_inst._SCPI_Instrument__connected = True
+        stub_inst._SCPI_Instrument__inst = LostResource()
+        assert stub_inst.connected
+        with pytest.raises(pyvisa.InvalidSession):
+            send()
+
+        assert not stub_inst.connected
+
+    stub_inst._SCPI_Instrument__connected = True
+    with pytest.raises(pyvisa.InvalidSession):
+        stub_inst.disconnect()
+
+    assert not stub_inst.connected
+
+def test_port_change():
+    # Assert changing port opens the new resource and drops cached responses.
+    inst = scpi.Instrument(**MOCK_INSTRUMENT)
+    inst.connect()
+    assert "*IDN?" in inst._SCPI_Instrument__query_cache
+
+    rid = "TCPIP0::0.0.0.2::inst0::INSTR"
+    inst.port = rid
+    assert inst.rid == rid
+    assert "*IDN?" not in inst._SCPI_Instrument__query_cache
+    assert not inst.connected
+
+    inst.connect()
+    assert inst.instrument.resource_name == rid
+    assert inst.id == "mock instrument"
+    inst.disconnect()
+
+def test_remote_on_connect(stub_inst):
+    # Assert the id is only queried on connection if enabled.
+    stub_inst.rid = "TCPIP::0.0.0.1::INSTR"
+    stub_inst.connect()
+    stub_inst.disconnect()
+    stub_inst.remote_on_connect = False
+    stub_inst.connect()
+    assert stub_inst.instrument.calls == [
+        ("open",),
+        ("query", "*IDN?"),
+        ("close",),
+        ("open",),
+    ]
+
+def test_handshake(inst):
+    inst.handshake = True
+    assert inst.handshake == "OK"
+    inst.freq(100.00)  # handshake reads the response
+
+    inst.handshake = False
+    assert inst.freq() == "100.00"
+
+def test_handshake_whitespace(stub_inst):
+    # Assert trailing whitespace of the handshake is ignored.
+    stub_inst.handshake = True
+    stub_inst.instrument.response = "OK\r"
+    stub_inst.write("FREQ 1")
+    assert stub_inst.instrument.calls == [("write", "FREQ 1"), ("read",)]
+
+    stub_inst.instrument.response = "ERR"
+    with pytest.raises(RuntimeError):
+        stub_inst.write("FREQ 1")
+
+def test_query_cache(inst):
+    assert inst.id is inst.id
+    assert inst.force_id() == "mock instrument"
+
+    inst.cache_policy["FREQ?"] = math.inf
+    assert inst.freq() == "100.00"
+
+    # change the value behind the cache
+    assert inst.instrument.query("FREQ 2.00") == "OK"
+    assert inst.freq() == "100.00"
+
+    # writes to the subsystem invalidate the cache
+    inst.freq(1.00)
+    assert inst.read() == "OK"
+    assert inst.freq() == "1.00"
+
+    inst.freq(100.00)
+    assert inst.read() == "OK"
+    del inst.cache_policy["FREQ?"]
+
+def test_command_group(inst):
+    with inst.command_group():
+        with pytest.raises(RuntimeError):
+            inst.freq()
+
+    assert inst.freq() == "100.00"
+
+    with inst.batch():
+        pass
+
+    with scpi.Instrument().batch():
+        pass
+
+def test_command_group_order(stub_inst):
+    # Assert all writes of a group are sent in order as one message.
+    with stub_inst.command_group():
+        stub_inst.freq(5)
+        stub_inst.write_many("SOUR:VOLT 1", "CURR 0.1", ":OUTP ON")
+        with pytest.raises(RuntimeError):
+            stub_inst.curv(binary=True)
+        with pytest.raises(RuntimeError):
+            stub_inst.query_ascii_values("TRAC:DATA?")
+
+    assert stub_inst.instrument.calls == [
+        ("write", ":FREQ 5;:SOUR:VOLT 1;CURR 0.1;:OUTP ON")
+    ]
+
+def test_resource_listing(monkeypatch):
+    # Assert instruments on the same backend share a listing of resources.
+    backend = MOCK_INSTRUMENT["backend"]
+    inst1 = scpi.Instrument("TCPIP0::0.0.0.2", backend=backend)
+    inst2 = scpi.Instrument("TCPIP0::0.0.0.2", backend=backend)
+    assert inst2.rid == "TCPIP0::0.0.0.2::inst0::INSTR"
+
+    resources, _ = inst1._list_resources()
+    assert inst2._list_resources() == (resources, True)
+
+    # a fresh listing is not repeated if nothing matches
+    rm = inst1._rm()
+    listings = []
+    list_resources = rm.list_resources
+    monkeypatch.setattr(rm, "list_resources", lambda: listings.append(1) or list_resources())
+    inst1.refresh_resources()
+    with pytest.raises(RuntimeError):
+        inst1.port = "TCPIP0::0.0.0.3"
+
+    assert len(listings) == 1
+
+    # a cached listing is refreshed if nothing matches
+    with pytest.raises(RuntimeError):
+        inst1.port = "TCPIP0::0.0.0.3"
+
+    assert len(listings) == 2
+
+def test_query_ascii_values(inst):
+    assert inst.query_ascii_values("TRAC:DATA?") == [1.5, 2.5, 3.5]
+    assert inst.query_ascii_values("TRAC:DATA?", container=tuple) == (1.5, 2.5, 3.5)
+
+def test_query_raw(inst):
+    assert inst.query_raw("*IDN?", 16) == b"mock instrument\n"
+    assert inst.freq() == "100.00"
+
+def test_query_many(inst):
+    assert inst.query_many("*IDN?", "*OPC?") == ["mock instrument", "1"]
+
+    inst.supports_compound = False
+    assert inst.query_many("*IDN?", "FREQ?") == ["mock instrument", "100.00"]
+    inst.supports_compound = True
+
+def test_property_cache(blank_inst):
+    # Assert properties are reused, and rebuilt when formatting changes.
+    assert blank_inst.a is blank_inst.a
+    assert blank_inst.a.b is blank_inst.a.b
+
+    prop = blank_inst.a
+    blank_inst.prefix_cmds = True
+    assert blank_inst.a is not prop
+    assert blank_inst.a.name == ":A"
+
+def test_release():
+    # Assert cached properties do not keep the instrument alive.
+    inst = scpi.Instrument()
+    resource = inst._SCPI_Instrument__inst = StubResource()
+    inst.a.b
+    gc.disable()
+    try:
+        del inst
+        assert resource.calls == [("close",)]
+    finally:
+        gc.enable()
+
+def test_declare_tree(blank_inst):
+    # Assert declared commands are built once and reused.
+    blank_inst.declare_tree({"meas": {"volt": {"dc": None}, "curr": None}})
+    meas = blank_inst._SCPI_Instrument__prop_cache["meas"]
+    volt = meas._Property__children["volt"]
+    assert "dc" in volt._Property__children
+
+    dc = blank_inst.meas.volt.dc
+    curr = blank_inst.meas.curr
+    assert blank_inst.meas.volt.dc is dc
+    assert blank_inst.meas.curr is curr
+    assert dc.name == "MEAS:VOLT:DC"
+
+
+def test_thread_async(inst):
+    async def run():
+        return await asyncio.gather(inst.aquery("*IDN?"), inst.aquery("FREQ?"))
+
+    assert asyncio.run(run()) == ["mock instrument", "100.00"]
+
+def test_thread_async_group(stub_inst):
+    # Assert thread offloaded calls do not wait on an active group.
+    async def run():
+        with stub_inst.command_group():
+            await asyncio.wait_for(stub_inst.awrite("FREQ 1"), 1)
+            with pytest.raises(RuntimeError):
+                await stub_inst.aquery("FREQ?")
+            with pytest.raises(RuntimeError):
+                await stub_inst.aread()
+
+    asyncio.run(run())
+    assert stub_inst.instrument.calls == [("write", ":FREQ 1")]
+
+def test_async_instrument():
+    async def run():
+        async with await scpi.connect_async(**MOCK_INSTRUMENT) as inst:
+            assert await inst.id == "mock instrument"
+            assert await inst.freq() == "100.00"
+            assert await inst.freq('MAX', query=True) == "100000.00"
+
+    asyncio.run(run())
+
+class EventResource:
+    # Resource without support for I/O completion events.
+    def __init__(self):
+        self.calls = []
+
+    def wrap_handler(self, handler):
+        return handler
+
+    def install_handler(self, event_type, handler):
+        self.calls.append("install_handler")
+
+    def enable_event(self, event_type, mechanism):
+        raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_invalid_event)
+
+    def uninstall_handler(self, event_type, handler, user_handle=None):
+        self.calls.append("uninstall_handler")
+
+def test_async_session_cleanup():
+    # Assert the event handler is removed if events can not be enabled.
+    inst = scpi.AsyncInstrument()
+    resource = inst.sync_instrument._SCPI_Instrument__inst = EventResource()
+
+    async def run():
+        async with inst.async_session():
+            pass
+
+    with pytest.raises(pyvisa.VisaIOError):
+        asyncio.run(run())
+
+    assert resource.calls == ["install_handler", "uninstall_handler"]
+
+def test_release_job():
+    # Assert buffers of completed event reads are discarded.
+    class Library:
+        _async_read_jobs = [(ctypes.c_uint32(1), b""), (ctypes.c_uint32(2), b"")]
+
+    scpi.async_scpi_instrument._release_job(Library, 1)
+    assert [jid.value for jid, _ in Library._async_read_jobs] == [2]
+
+def test_raw_socket():
+    server = socket.create_server(("127.0.0.1", 0))
+    host, port = server.getsockname()
+
+    responses = {
+        b"*IDN?": b"raw instrument\n",
+        b"TRAC:DATA?": b"1.5,2.5\n",
+        b"CURV?": b"#18" + struct.pack("<2f", 1.5, 2.5) + b"\n",
+    }
+
+    def serve():
+        conn, _ = server.accept()
+        with conn, conn.makefile("rb") as stream:
+            for line in stream:
+                resp = responses.get(line.strip())
+                if resp is not None:
+                    conn.sendall(resp)
+
+    threading.Thread(target=serve, daemon=True).start()
+    with server:
+        inst = scpi.Instrument(port=f"TCPIP::{host}::{port}::SOCKET", backend="@raw")
+        with inst:
+            assert inst.connected
+            assert inst.id == "raw instrument"
+            assert inst.query_ascii_values("TRAC:DATA?") == [1.5, 2.5]
+            assert inst.curv(binary=True) == [1.5, 2.5]
+
+        assert not inst.connected
\ No newline at end of file